@@ -8,13 +8,31 @@ __author__  = "Dortania"
 __url__     = "https://www.github.com/dortania/MetallibSupportPkg"
 
 
-from .cli            import main
+import importlib
 
-from .ipsw.fetch     import FetchIPSW
-from .ipsw.extract   import IPSWExtract
 
-from .metallib.fetch import MetallibFetch
-from .metallib.patch import MetallibPatch
+# Exports are imported on first access (PEP 562)
+# Avoids loading the entire patching stack when only a single step is run
+_LAZY_EXPORTS = {
+    "main":          ".cli",
 
-from .utils.log      import log
-from .utils.download import DownloadFile
\ No newline at end of file
+    "FetchIPSW":     ".ipsw.fetch",
+    "IPSWExtract":   ".ipsw.extract",
+
+    "MetallibFetch": ".metallib.fetch",
+    "MetallibPatch": ".metallib.patch",
+
+    "log":           ".utils.log",
+    "DownloadFile":  ".utils.download",
+}
+
+__all__ = list(_LAZY_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(_LAZY_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
\ No newline at end of file
@@ -3,10 +3,9 @@ cli.py: Command Line Interface for MetallibSupportPkg patching utilities
 """
 
 import argparse
-import macos_pkg_builder
-import mac_signing_buddy
 
-from pathlib import Path
+from pathlib            import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from .                   import __version__, __url__
 from .ipsw.fetch         import FetchIPSW
@@ -19,6 +18,9 @@ from .utils.ci_info      import CIInfo
 from .utils.patch_format import GenerateSysPatchDictionary
 
 
+PKG_WELCOME = "# MetallibSupportPkg\n\nThis package installs patched Metal Libraries for usage with OpenCore Legacy Patcher specifically targeting Macs with Metal 3802-based Graphics cards on macOS 15, Sequoia and newer.\n\nAffected graphics card models:\n\n* Intel Ivy Bridge and Haswell iGPUs\n* Nvidia Kepler dGPUs\n\n----------\nInstall destination:\n\n* `/Library/Application Support/Dortania/MetallibSupportPkg/{name}`\n\n----------\n\nFor more information, see the [MetallibSupportPkg repository]({url})."
+
+
 def download(ci: bool = False) -> str:
     """
     Fetches and downloads latest IPSW
@@ -29,13 +31,17 @@ def download(ci: bool = False) -> str:
     Returns:
     - IPSW file path
     """
-    builds_to_ignore = []
     if ci is True:
-        builds_to_ignore = CIInfo().published_releases()
-    url = FetchIPSW(builds_to_ignore).fetch()
+        # Both lookups are network bound, so the published releases load while AppleDB downloads
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            ipsw = FetchIPSW(executor.submit(CIInfo().published_releases).result)
+            url = ipsw.fetch()
+    else:
+        ipsw = FetchIPSW()
+        url = ipsw.fetch()
     if url is None or url == {}:
         return ""
-    file = DownloadFile(url).file()
+    file = DownloadFile(url, ipsw.hash).file()
     return file
 
 
@@ -76,6 +82,7 @@ def patch(input: str = "/", multiprocessing: bool = False) -> None:
 
     Parameters:
     - input: str, path to the system volume or DMG
+    - multiprocessing: boolean, if True, patches files in parallel across all CPU cores
 
     Returns:
     - None
@@ -90,6 +97,8 @@ def build_pkg(input: str, pkg_signing_identity: str = None, notarization_team_id
     """
     Builds a macOS package from a given directory
     """
+    # Imported here as they're only needed for packaging
+    import macos_pkg_builder
 
     name = Path(input).name
     assert macos_pkg_builder.Packages(
@@ -100,13 +109,15 @@ def build_pkg(input: str, pkg_signing_identity: str = None, notarization_team_id
             input:        f"/Library/Application Support/Dortania/MetallibSupportPkg/{name}",
             "Info.plist": f"/Library/Application Support/Dortania/MetallibSupportPkg/{name}/Info.plist",
         },
-        pkg_welcome=f"# MetallibSupportPkg\n\nThis package installs patched Metal Libraries for usage with OpenCore Legacy Patcher specifically targeting Macs with Metal 3802-based Graphics cards on macOS 15, Sequoia and newer.\n\nAffected graphics card models:\n\n* Intel Ivy Bridge and Haswell iGPUs\n* Nvidia Kepler dGPUs\n\n----------\nInstall destination:\n\n* `/Library/Application Support/Dortania/MetallibSupportPkg/{Path(input).name}`\n\n----------\n\nFor more information, see the [MetallibSupportPkg repository]({__url__}).",
+        pkg_welcome=PKG_WELCOME.format(name=name, url=__url__),
         pkg_title=f"MetallibSupportPkg for {name}",
         pkg_as_distribution=True,
         **({"pkg_signing_identity": pkg_signing_identity} if pkg_signing_identity else {}),
     ).build() is True
 
     if all([notarization_team_id, notarization_apple_id, notarization_password]):
+        import mac_signing_buddy
+
         mac_signing_buddy.Notarize(
             file=f"MetallibSupportPkg-{name}.pkg",
             team_id=notarization_team_id,
@@ -2,8 +2,9 @@
 extract.py: Extract System Volume from IPSW images
 """
 
+import os
+import shutil
 import zipfile
-import tempfile
 import plistlib
 import subprocess
 
@@ -12,6 +13,9 @@ from pathlib import Path
 from ..utils.log import log
 
 
+COPY_BUFFER_SIZE = 4 * 1024 * 1024
+
+
 class IPSWExtract:
 
     def __init__(self, ipsw: str) -> None:
@@ -48,13 +52,11 @@ class IPSWExtract:
         """
         Extract the system volume from an IPSW file.
         """
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            with zipfile.ZipFile(self._ipsw, "r") as zip_ref:
-                zip_ref.extractall(tmp_dir)
-
-            with open(f"{tmp_dir}/BuildManifest.plist", "rb") as f:
-                build_manifest = plistlib.load(f)
+        with zipfile.ZipFile(self._ipsw, "r") as zip_ref:
+            # Only the manifest and the system image are needed, avoid unpacking the entire IPSW
+            build_manifest = plistlib.loads(zip_ref.read("BuildManifest.plist"))
 
+            system_image_path = None
             for build_identity in build_manifest["BuildIdentities"]:
                 if build_identity["Ap,ProductType"] == "VirtualMac2,1":
                     system_image_path = build_identity["Manifest"]["OS"]["Info"]["Path"]
@@ -63,19 +65,24 @@ class IPSWExtract:
             if not system_image_path:
                 raise Exception("Failed to find system image path")
 
-            system_image_path = Path(tmp_dir, system_image_path)
-
-            if system_image_path.suffix == ".aea":
-                system_image_path = self._decrypt_aea(system_image_path)
+            # Stage next to the destination so the result can be renamed into place
+            # Avoids a second full write of the image from the system temporary directory
+            staging_directory = Path.cwd() / f".ipsw_stage_{os.getpid()}"
+            staging_directory.mkdir()
+            try:
+                system_image = staging_directory / Path(system_image_path).name
+                with zip_ref.open(system_image_path) as source, open(system_image, "wb") as destination:
+                    shutil.copyfileobj(source, destination, COPY_BUFFER_SIZE)
 
-            # Copy from tmp_dir to cwd
-            result = subprocess.run(["/bin/cp", "-cr", system_image_path, "."], capture_output=True, text=True)
-            if result.returncode != 0:
-                log(result)
-                raise Exception(f"Failed to copy {system_image_path}")
+                if system_image.suffix == ".aea":
+                    system_image = self._decrypt_aea(system_image)
 
+                output = Path(system_image.name)
+                os.replace(system_image, output)
+            finally:
+                shutil.rmtree(staging_directory, ignore_errors=True)
 
-        return system_image_path.name
+        return output.name
 
 
     def extract(self) -> str:
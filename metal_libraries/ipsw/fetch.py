@@ -2,9 +2,15 @@
 fetch.py: Fetch latest IPSW images for macOS
 """
 
+import io
+import os
+import ijson
 import plistlib
 import packaging.version
 
+from typing  import Union, Callable
+from pathlib import Path
+
 from .manifest import MetallibSupportPkgManifest
 
 from ..network import NetworkUtilities
@@ -12,91 +18,114 @@ from .. import __version__
 
 class FetchIPSW:
 
-    def __init__(self, builds_to_ignore: list = [], minimum_version: str = "15") -> None:
+    def __init__(self, builds_to_ignore: Union[list, Callable[[], list]] = [], minimum_version: str = "15") -> None:
+        """
+        Parameters:
+            builds_to_ignore: Builds to skip, or a zero-argument callable returning them
+                              A callable is only invoked once AppleDB has been downloaded
+            minimum_version:  Oldest macOS version to consider
+        """
         self._builds_to_ignore = builds_to_ignore
         self._minimum_version  = packaging.version.parse(minimum_version)
 
+        # SHA1 of the latest IPSW, populated by fetch()
+        self.hash: str = None
+
 
-    def _fetch_apple_db_items(self) -> dict:
+    def _fetch_apple_db_items(self) -> list:
         """
         Get macOS installers from AppleDB
         """
 
-        installers = [
+        # Keyed by build, so duplicate links collapse as they're found
+        installers = {
             # "22F82": {
             #   url: "https://swcdn.apple.com/content/downloads/36/06/042-01917-A_B57IOY75IU/oocuh8ap7y8l8vhu6ria5aqk7edd262orj/InstallAssistant.pkg",
             #   version: "13.4.1",
             #   build: "22F82",
             # }
-        ]
+        }
 
         apple_db = NetworkUtilities().get("https://api.appledb.dev/main.json")
-        if apple_db is None:
-            return installers
+        if apple_db.status_code != 200:
+            return []
+
+        builds_to_ignore = self._builds_to_ignore
+        if callable(builds_to_ignore):
+            builds_to_ignore = builds_to_ignore()
+
+        # Hoisted out of the loop, runs once per AppleDB entry
+        builds_to_ignore = frozenset(builds_to_ignore)
+        minimum_version  = self._minimum_version
+        parse            = packaging.version.parse
+
+        # Lazily walk the 'ios' group, avoids materializing the rest of the document as Python objects
+        for item in ijson.items(io.BytesIO(apple_db.content), "ios.item"):
+            get = item.get
 
-        apple_db = apple_db.json()
-        for group in apple_db:
-            if group != "ios":
+            # Cheapest and most selective rejection first, the group is mostly non-macOS
+            if get("osStr") != "macOS":
+                continue
+
+            build = get("build")
+            if build is None or build in builds_to_ignore:
+                continue
+
+            version = get("version")
+            if version is None or "sources" not in item:
                 continue
-            for item in apple_db[group]:
-                if "osStr" not in item:
-                    continue
-                if item["osStr"] != "macOS":
-                    continue
-                if "build" not in item:
-                    continue
-                if "version" not in item:
-                    continue
-                if "sources" not in item:
-                    continue
 
-                if item["build"] in self._builds_to_ignore:
+            # Strip beta/RC suffixes, ex. '15.0 beta 7' -> '15.0'
+            base_version = version.split(" ")[0]
+            try:
+                if parse(base_version) < minimum_version:
                     continue
+            except packaging.version.InvalidVersion:
+                continue
 
-                try:
-                    if packaging.version.parse(item["version"].split(" ")[0]) < self._minimum_version:
-                        continue
-                except packaging.version.InvalidVersion:
+            name = "macOS"
+            if "appledbWebImage" in item:
+                if "id" in item["appledbWebImage"]:
+                    name += " " + item["appledbWebImage"]["id"]
+
+            for source in item["sources"]:
+                if "links" not in source:
                     continue
 
-                name = "macOS"
-                if "appledbWebImage" in item:
-                    if "id" in item["appledbWebImage"]:
-                        name += " " + item["appledbWebImage"]["id"]
+                hash = None
+                if "hashes" in source:
+                    if "sha1" in source["hashes"]:
+                        hash = source["hashes"]["sha1"]
 
-                for source in item["sources"]:
-                    if "links" not in source:
+                for entry in source["links"]:
+                    if "url" not in entry:
+                        continue
+                    if entry["url"].endswith(".ipsw") is False:
                         continue
+                    if "preferred" in entry:
+                        if entry["preferred"] is False:
+                            continue
 
-                    hash = None
-                    if "hashes" in source:
-                        if "sha1" in source["hashes"]:
-                            hash = source["hashes"]["sha1"]
+                    # Last link seen wins, but the build keeps its first-seen position
+                    installers[build] = {
+                        "Name":      name,
+                        "Version":   version,
+                        "Build":     build,
+                        "URL":       entry["url"],
+                        "Variant":   "Beta" if item["beta"] else "Public",
+                        "Date":      item["released"],
+                        "Hash":      hash,
 
-                    for entry in source["links"]:
-                        if "url" not in entry:
-                            continue
-                        if entry["url"].endswith(".ipsw") is False:
-                            continue
-                        if "preferred" in entry:
-                            if entry["preferred"] is False:
-                                continue
-
-                        installers.append({
-                            "Name":      name,
-                            "Version":   item["version"],
-                            "Build":     item["build"],
-                            "URL":       entry["url"],
-                            "Variant":   "Beta" if item["beta"] else "Public",
-                            "Date":      item["released"],
-                            "Hash":      hash,
-                        })
-
-        # Deduplicate builds
-        installers = list({installer['Build']: installer for installer in installers}.values())
-
-        # Reverse list
-        installers = installers[::-1]
+                        # Internal, not saved to Info.plist
+                        "_version_base": base_version,
+                    }
+
+        installers = list(installers.values())
+
+        # Newest release first
+        # Reversed beforehand so same-day releases keep the later AppleDB entry first, sort is stable
+        installers.reverse()
+        installers.sort(key=lambda x: x["Date"], reverse=True)
 
         return installers
 
@@ -105,9 +134,13 @@ class FetchIPSW:
         """
         Save the build info to Info.plist
         """
+        info = {key: value for key, value in info.items() if not key.startswith("_")}
         info["MetallibSupportPkgVersion"] = __version__
-        with open("Info.plist", "wb") as file:
-            plistlib.dump(info, file)
+
+        # Serialize in memory, then write to a sibling and rename
+        # Avoids leaving a partial file behind if the run is cancelled
+        Path("Info.plist.tmp").write_bytes(plistlib.dumps(info))
+        os.replace("Info.plist.tmp", "Info.plist")
 
 
     def fetch(self) -> dict:
@@ -119,4 +152,5 @@ class FetchIPSW:
             return {}
         MetallibSupportPkgManifest(result[0]).update_manifest()
         self._save_info(result[0])
+        self.hash = result[0]["Hash"]
         return result[0]["URL"]
\ No newline at end of file
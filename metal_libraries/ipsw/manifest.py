@@ -2,6 +2,7 @@
 manifest.py: Generate manifest.json for MetallibSupportPkg API
 """
 
+import os
 import json
 
 from pathlib  import Path
@@ -9,6 +10,12 @@ from datetime import datetime
 
 from ..network import NetworkUtilities
 
+# Optional, faster decoding of the published manifest
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 METALLIB_API_LINK = "https://dortania.github.io/MetallibSupportPkg/manifest.json"
 
@@ -36,9 +43,10 @@ class MetallibSupportPkgManifest:
         """
         Generate manifest.json for MetallibSupportPkg API
         """
-        version = self._latest_ipsw["Version"]
-        if " " in version:
-            version = version.split(" ")[0]
+        # Prefer the base version computed while filtering AppleDB
+        version = self._latest_ipsw.get("_version_base")
+        if version is None:
+            version = self._latest_ipsw["Version"].split(" ")[0]
         manifest = {
             "build":     self._latest_ipsw["Build"],
             "version":   version,
@@ -60,7 +68,8 @@ class MetallibSupportPkgManifest:
 
         # Fetch current manifest
         try:
-            current_manifest = NetworkUtilities().get(METALLIB_API_LINK).json()
+            response = NetworkUtilities().get(METALLIB_API_LINK)
+            current_manifest = orjson.loads(response.content) if orjson else response.json()
         except:
             current_manifest = []
 
@@ -69,20 +78,20 @@ class MetallibSupportPkgManifest:
             current_manifest = []
 
         # Check if item already exists
-        for item in current_manifest:
-            if item["build"] == data["build"]:
-                return
+        if data["build"] in {item["build"] for item in current_manifest}:
+            return
 
         # Add new item
         current_manifest.append(data)
 
-        # Sort by date
-        current_manifest = sorted(current_manifest, key=lambda x: datetime.strptime(x["date"], "%Y-%m-%d"), reverse=True)
+        # Sort by date, YYYY-MM-DD strings already order chronologically
+        current_manifest.sort(key=lambda x: x["date"], reverse=True)
 
         # Create deploy directory
         Path("deploy").mkdir(exist_ok=True)
 
-        # Write manifest
-        with open("deploy/manifest.json", "w") as f:
-            json.dump(current_manifest, f, indent=4)
+        # Write manifest, serialized in memory and renamed into place
+        # Encoded with json, as orjson can't reproduce the 4-space indentation of the published file
+        Path("deploy/manifest.json.tmp").write_bytes(json.dumps(current_manifest, indent=4).encode())
+        os.replace("deploy/manifest.json.tmp", "deploy/manifest.json")
 
@@ -2,12 +2,18 @@
 fetch.py: Fetches all '.metallib' files from given path and backs them up.
 """
 
+import os
+import re
+import shutil
 import plistlib
-import subprocess
 
-from pathlib import Path
+from pathlib            import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from ..utils.log import log
+from ..utils.walk import iter_metallibs
+
+
+SYSTEM_VERSION_PATTERN = re.compile(rb"<key>(ProductVersion|ProductBuildVersion)</key>\s*<string>([^<]+)</string>")
 
 
 class MetallibFetch:
@@ -16,6 +22,12 @@ class MetallibFetch:
         self._input  = Path(input)
         self._output = Path(output) if output else self._build_output()
 
+        # Precomputed for str.endswith(), matched in C rather than a per-file Python loop
+        # Known broken directories are pruned during the walk, alongside the kext tree
+        known_broken_files = self._known_broken_files()
+        self._broken_files     = tuple(file for file in known_broken_files if file.endswith(".metallib"))
+        self._skip_directories = ("/System/Library/Extensions",) + tuple(file for file in known_broken_files if not file.endswith(".metallib"))
+
 
     def _known_broken_files(self) -> list[str]:
         """
@@ -44,7 +56,15 @@ class MetallibFetch:
         if not version_file.exists():
             raise Exception("SystemVersion.plist not found")
 
-        version_data = plistlib.load(open(version_file, "rb"))
+        with open(version_file, "rb") as f:
+            data = f.read()
+
+        # Only two keys are needed, pull them from the XML directly
+        # Fall back to plistlib for anything unexpected (ex. binary plists)
+        version_data = {key.decode(): value.decode() for key, value in SYSTEM_VERSION_PATTERN.findall(data)}
+        if "ProductVersion" not in version_data or "ProductBuildVersion" not in version_data:
+            version_data = plistlib.loads(data)
+
         version = version_data["ProductVersion"]
         build   = version_data["ProductBuildVersion"]
 
@@ -61,37 +81,35 @@ class MetallibFetch:
             Path(self._input, "System/iOSSupport"),
         ]
         files = []
-        bad_files = self._known_broken_files()
         for path in paths:
-            for file in path.rglob("**/*.metallib"):
-                if "System/Library/Extensions" in str(file):
+            for file in iter_metallibs(path, self._skip_directories):
+                if file.endswith(self._broken_files):
                     continue
-                if file.is_symlink():
-                    continue
-                if any(bad_file in str(file) for bad_file in bad_files):
-                    continue
-                files.append(file)
+                files.append(Path(file))
         return files
 
 
     def _backup(self) -> Path:
         """
         Backup all metallib files
+
+        Copies in-process and in parallel, rather than forking /bin/cp for each file
         """
         if self._output.exists():
-            result = subprocess.run(["/bin/rm", "-rf", self._output], capture_output=True, text=True)
-            if result.returncode != 0:
-                log(result)
-                raise Exception(f"Failed to remove {self._output}")
+            shutil.rmtree(self._output)
         self._output.mkdir(parents=True)
 
-        for file in self._fetch_files():
-            output = Path(self._output, file.relative_to(self._input))
-            output.parent.mkdir(parents=True, exist_ok=True)
-            result = subprocess.run(["/bin/cp", "-r", file, output], capture_output=True, text=True)
-            if result.returncode != 0:
-                log(result)
-                raise Exception(f"Failed to copy {file} to {output}")
+        copies = [(file, Path(self._output, file.relative_to(self._input))) for file in self._fetch_files()]
+        for directory in {output.parent for _, output in copies}:
+            directory.mkdir(parents=True, exist_ok=True)
+
+        # Each copy is independent and I/O bound (releases the GIL), so threads overlap them
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+            futures = {executor.submit(shutil.copy2, file, output): file for file, output in copies}
+            errors = [f"{futures[future]}: {future.exception()}" for future in as_completed(futures) if future.exception()]
+
+        if errors:
+            raise Exception("Failed to copy:\n" + "\n".join(errors))
 
         return self._output
 
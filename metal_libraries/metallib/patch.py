@@ -29,21 +29,86 @@ Manual steps:
 6. Pack all .air files into a new .metallib file
 """
 
+import os
 import re
+import mmap
+import functools
+import contextlib
 import struct
 import tempfile
 import subprocess
-import multiprocessing
 
-from pathlib import Path
-from typing import Optional
+from pathlib            import Path
+from typing             import Optional, Union
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
-from ..utils.log import log
+from ..utils.log  import log
+from ..utils.walk import iter_metallibs
+
+
+# Below this many files, worker start-up outweighs the parallel speedup
+MULTIPROCESSING_THRESHOLD = 25
+
+# Little-endian integer readers for the metallib header and tags
+_U32 = struct.Struct("<I").unpack_from
+# Tag header: 4-byte type followed by a 16-bit payload length
+_TAG_HEADER = struct.Struct("<4sH").unpack_from
+
+# Sampler state arrays, collapsed to a single i64 for AIR 2.6
+SAMPLER_STATE_PATTERN = re.compile(r"\[2 x i64\] \[i64 ([0-9]+), i64 0\]")
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve_tool(tool: str) -> str:
+    """
+    Resolve a Metal toolchain binary through xcrun
+
+    Cached per process, so each compile step spawns the tool directly instead of going through xcrun
+    """
+    result = subprocess.run(["/usr/bin/xcrun", "-f", tool], capture_output=True, text=True)
+    if result.returncode != 0:
+        log(result)
+        raise Exception(f"Failed to locate {tool}")
+
+    return result.stdout.strip()
+
+
+@functools.lru_cache(maxsize=None)
+def _tool_environment() -> dict:
+    """
+    Environment for toolchain binaries invoked without xcrun
+
+    xcrun exports SDKROOT before handing off to the tool, mirror that once here
+    """
+    if "SDKROOT" in os.environ:
+        return dict(os.environ)
+
+    result = subprocess.run(["/usr/bin/xcrun", "--show-sdk-path"], capture_output=True, text=True)
+    if result.returncode != 0:
+        log(result)
+        raise Exception("Failed to locate the macOS SDK")
+
+    return {**os.environ, "SDKROOT": result.stdout.strip()}
+
+
+@contextlib.contextmanager
+def _map_file(input: str):
+    """
+    Map a file read-only for the duration of the context
+    """
+    with open(input, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
 
 
 class MetallibPatch:
 
-    def __init__(self) -> None:
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        """
+        Parameters:
+            max_workers: Number of concurrent Metal toolchain invocations per metallib, defaults to the CPU count
+        """
+        self._max_workers = max_workers or os.cpu_count() or 1
+
         self._broken_file_map = {
             "metallib": {
                 "/System/Library/PrivateFrameworks/VectorKit.framework/Versions/A/Resources/default.metallib": [
@@ -57,6 +122,10 @@ class MetallibPatch:
             "ll": {},
         }
 
+        # Flattened for per-entry lookups in patch()
+        self._broken_metallibs = tuple(self._broken_file_map["metallib"].keys())
+        self._broken_functions = {(path, function) for path, functions in self._broken_file_map["metallib"].items() for function in functions}
+
 
     def _recompile_ll_to_air(self, input: str) -> str:
         """
@@ -67,7 +136,7 @@ class MetallibPatch:
         """
         output = Path(input).with_suffix(".air")
 
-        result = subprocess.run(["/usr/bin/xcrun", "metal", "-c", "-mmacos-version-min=14.0", input, "-o", output], capture_output=True, text=True)
+        result = subprocess.run([_resolve_tool("metal"), "-c", "-mmacos-version-min=14.0", input, "-o", output], capture_output=True, text=True, env=_tool_environment())
         if result.returncode != 0:
             log(result)
             raise Exception(f"Failed to recompile {input}")
@@ -84,28 +153,21 @@ class MetallibPatch:
         """
         output = Path(input).with_suffix(".ll")
 
-        result = subprocess.run(["/usr/bin/xcrun", "metal-objdump", "--disassemble", input], capture_output=True, text=True)
+        result = subprocess.run([_resolve_tool("metal-objdump"), "--disassemble", input], capture_output=True, text=True, env=_tool_environment())
         if result.returncode != 0:
             log(result)
             raise Exception(f"Failed to decompile {input}")
 
 
-        entry_point = None
-        for line in result.stdout.splitlines():
-            if "; ModuleID = " not in line:
-                continue
-            entry_point = line
-            break
-
-        assert(entry_point != None)
+        # Drop everything before the line holding the module header
+        entry_point = result.stdout.find("; ModuleID = ")
+        assert(entry_point != -1)
+        entry_point = result.stdout.rfind("\n", 0, entry_point) + 1
 
-        with open(output, "w") as f:
-            hit_entry = False
-            for line in result.stdout.splitlines():
-                if line == entry_point:
-                    hit_entry = True
-                if hit_entry is True:
-                    f.write(f"{line}\n")
+        contents = result.stdout[entry_point:]
+        if not contents.endswith("\n"):
+            contents += "\n"
+        Path(output).write_text(contents)
 
         return output
 
@@ -117,7 +179,7 @@ class MetallibPatch:
         Returns:
         - Path to the packed .metallib
         """
-        result = subprocess.run(["/usr/bin/xcrun", "metallib", *input_, "-o", output], capture_output=True, text=True)
+        result = subprocess.run([_resolve_tool("metallib"), *input_, "-o", output], capture_output=True, text=True, env=_tool_environment())
         if result.returncode != 0:
             log(result)
             raise Exception(f"Failed to pack {input_} into {output}")
@@ -125,10 +187,13 @@ class MetallibPatch:
         return output
 
 
-    def _unpack_metallib_to_air(self, input: str) -> list[tuple[str, bytes]]:
+    def _unpack_metallib_to_air(self, input: Union[str, bytes]) -> list[tuple[str, bytes]]:
         """
         Unpack .metallib into .air files
 
+        Parameters:
+        - input: Path to the .metallib, or its contents if already in memory
+
         Returns:
         - List of tuples containing the function name and its contents
         """
@@ -138,52 +203,52 @@ class MetallibPatch:
         END_OF_TAG   = b"ENDT"
         BITCODE_SIZE = b"MDSZ"
 
-        def u32(a: bytes, i: int) -> int:
-            """
-            Read a 32-bit unsigned integer from a byte array
-            """
-            return a[i] | a[i+1] << 8 | a[i+2] << 16 | a[i+3] << 24
-
-        def u16(a: bytes, i: int) -> int:
-            """
-            Read a 16-bit unsigned integer from a byte array
-            """
-            return a[i] | a[i+1] << 8
-
-        # Read the metallib file
-        metallib_data = Path(input).read_bytes()
-        # 2E000000
-        if metallib_data[:4] != HEADER and metallib_data[4:8] != b"\x2E\x00\x00\x00":
-            print(metallib_data[:4])
-            raise Exception(f"Invalid metallib file: {input}")
-
-        # Parse the metallib file for .air files
-        directory_offset  = u32(metallib_data, 24)
-        number_of_entries = u32(metallib_data, directory_offset)
-        current_offset    = directory_offset + 4
-
-        entries = []
-        for i in range(number_of_entries):
-            current_offset += 4
-            while True:
-                tag_type = metallib_data[current_offset:current_offset+4]
-                if tag_type == END_OF_TAG:
-                    current_offset += 4
-                    break
-                tag_length = u16(metallib_data, current_offset + 4)
-                if tag_type == TAG_NAME:
-                    entry_name = metallib_data[current_offset + 6:current_offset + 6 + tag_length - 1].decode("utf-8")
-                elif tag_type == BITCODE_SIZE:
-                    entry_size = u32(metallib_data, current_offset + 6)
-                current_offset += 6 + tag_length
-            entries.append((entry_name, entry_size))
-
-        # Extract the .air files
-        payload_offset = u32(metallib_data, 72)
-        air_files = []
-        for entry in entries:
-            air_files.append((entry[0],metallib_data[payload_offset:payload_offset + entry[1]]))
-            payload_offset += entry[1]
+        # Files are mapped, so only the directory and payload slices get paged in
+        # Slice through a view so tag compares don't copy
+        if isinstance(input, (bytes, bytearray, memoryview)):
+            source, source_name = contextlib.nullcontext(input), "(in memory)"
+        else:
+            source, source_name = _map_file(input), input
+
+        with source as metallib_data, memoryview(metallib_data) as mv:
+            # 2E000000
+            if metallib_data[:4] != HEADER and metallib_data[4:8] != b"\x2E\x00\x00\x00":
+                print(metallib_data[:4])
+                raise Exception(f"Invalid metallib file: {source_name}")
+
+            # Parse the metallib file for .air files
+            directory_offset  = _U32(metallib_data, 24)[0]
+            number_of_entries = _U32(metallib_data, directory_offset)[0]
+            current_offset    = directory_offset + 4
+
+            # Only the tags needed to locate each .air payload are decoded, the rest are skipped
+            tag_handlers = {
+                TAG_NAME:     lambda offset, length: bytes(mv[offset:offset + length - 1]).decode("utf-8"),
+                BITCODE_SIZE: lambda offset, length: _U32(metallib_data, offset)[0],
+            }
+
+            entries = []
+            for i in range(number_of_entries):
+                current_offset += 4
+                entry = {}
+                while True:
+                    # ENDT carries no length, only the tag itself is consumed
+                    if mv[current_offset:current_offset + 4] == END_OF_TAG:
+                        current_offset += 4
+                        break
+                    tag_type, tag_length = _TAG_HEADER(metallib_data, current_offset)
+                    handler = tag_handlers.get(tag_type)
+                    if handler is not None:
+                        entry[tag_type] = handler(current_offset + 6, tag_length)
+                    current_offset += 6 + tag_length
+                entries.append((entry[TAG_NAME], entry[BITCODE_SIZE]))
+
+            # Extract the .air files
+            payload_offset = _U32(metallib_data, 72)[0]
+            air_files = []
+            for entry in entries:
+                air_files.append((entry[0], bytes(mv[payload_offset:payload_offset + entry[1]])))
+                payload_offset += entry[1]
 
         return air_files
 
@@ -200,20 +265,16 @@ class MetallibPatch:
                 return line.replace("i32 2", "i32 1")
 
             if r'@__air_sampler_state' in line and r'[2 x i64]' in line:
-                match = re.search(r"\[2 x i64\] \[i64 ([0-9]+), i64 0\]", line)
+                match = SAMPLER_STATE_PATTERN.search(line)
                 if match:
                     return line.replace(match.group(0), f"i64 {match.group(1)}")
                 return line.replace("[2 x i64]", "i64")
 
             return line
 
-        ll_data = Path(input).read_text()
-        for line in ll_data.splitlines():
-            new_line = patch_line(line)
-            if new_line != line:
-                ll_data = ll_data.replace(line, new_line)
-
-        Path(input).write_text(ll_data)
+        # Patch line by line, rescanning the whole file per hit is quadratic
+        lines = Path(input).read_text().splitlines(keepends=True)
+        Path(input).write_text("".join([patch_line(line) for line in lines]))
 
 
     def _thin_file(self, input: str) -> Optional[bytes]:
@@ -245,30 +306,36 @@ class MetallibPatch:
         CPU_TYPE_INTEL_GPU = 0x1000015
         CPU_TYPE_AIR64 = 0x1000017
 
-        data = Path(str(input)).read_bytes()
-
-        magic, architecture_count = struct.unpack_from(FAT_HEADER_FORMAT, data)
-        if magic == FAT_MAGIC:
-            pass
-        elif magic == FAT_CIGAM:
-            raise ValueError("Malformed FAT binary (FAT_CIGAM is not allowed)")
-        elif magic == FAT_MAGIC_64:
-            raise ValueError("64-bit FAT binaries are not currently supported")
-        elif magic == FAT_CIGAM_64:
-            raise ValueError("Malformed FAT binary (FAT_CIGAM_64 is not allowed)")
-        else:
-            return None
-
-        fat_archs = data[FAT_HEADER_SIZE : FAT_HEADER_SIZE + architecture_count * FAT_ARCH_SIZE]
-
-        for cpu_type, cpu_subtype, offset, size, align in struct.iter_unpack(FAT_ARCH_FORMAT, fat_archs):
-            if cpu_type != CPU_TYPE_AIR64:
-                continue
+        # Most metallibs aren't FAT, so only read the header until the magic says otherwise
+        # Past that, only the architecture table and the AIR64 slice are read
+        with open(input, "rb") as f:
+            header = f.read(FAT_HEADER_SIZE)
+            if len(header) < FAT_HEADER_SIZE:
+                return None
+
+            magic, architecture_count = struct.unpack(FAT_HEADER_FORMAT, header)
+            if magic == FAT_MAGIC:
+                pass
+            elif magic == FAT_CIGAM:
+                raise ValueError("Malformed FAT binary (FAT_CIGAM is not allowed)")
+            elif magic == FAT_MAGIC_64:
+                raise ValueError("64-bit FAT binaries are not currently supported")
+            elif magic == FAT_CIGAM_64:
+                raise ValueError("Malformed FAT binary (FAT_CIGAM_64 is not allowed)")
+            else:
+                return None
+
+            fat_archs = f.read(architecture_count * FAT_ARCH_SIZE)
+
+            for cpu_type, cpu_subtype, offset, size, align in struct.iter_unpack(FAT_ARCH_FORMAT, fat_archs):
+                if cpu_type != CPU_TYPE_AIR64:
+                    continue
 
-            air64_contents = data[offset : offset + size]
-            return air64_contents
+                f.seek(offset)
+                air64_contents = f.read(size)
+                return air64_contents
 
-        return "DOES NOT CONTAIN AIR64 ARCHITECTURE"
+            return "DOES NOT CONTAIN AIR64 ARCHITECTURE"
 
 
     def patch(self, input: str, output: str) -> None:
@@ -277,21 +344,24 @@ class MetallibPatch:
         """
         file = Path(input)
 
+        # Known broken functions are listed by the metallib's install path
+        broken_metallib = next((path for path in self._broken_metallibs if str(file).endswith(path)), None)
+
         with tempfile.TemporaryDirectory() as tmp:
             tmp_output = Path(tmp)
 
+            metallib = file
             result = self._thin_file(file)
             if result:
                 if result == "DOES NOT CONTAIN AIR64 ARCHITECTURE":
                     print("- Does not contain AIR64 architecture")
                     return
-                # Change all future references to the thinned .metallib
+                # Unpack the thinned .metallib straight from memory
                 print("- Thinned .metallib")
-                file = Path(tmp_output / file.name)
-                file.write_bytes(result)
+                metallib = result
 
             print("- Unpacking into .air files")
-            entries = self._unpack_metallib_to_air(file)
+            entries = self._unpack_metallib_to_air(metallib)
             for entry in entries:
                 function_name = entry[0]
                 contents = entry[1]
@@ -300,39 +370,22 @@ class MetallibPatch:
                 if contents == b"":
                     continue
 
-                is_broken = False
-                if len(self._broken_file_map["metallib"]) > 0:
-                    for key, value in self._broken_file_map["metallib"].items():
-                        for function in value:
-                            if function_name != function:
-                                continue
-                            if not str(file).endswith(key):
-                                continue
-                            print(f"  - Skipping {function_name} as it is known to be broken")
-                            is_broken = True
-                            break
-                        if is_broken:
-                            break
-                if is_broken:
+                if broken_metallib and (broken_metallib, function_name) in self._broken_functions:
+                    print(f"  - Skipping {function_name} as it is known to be broken")
                     continue
 
                 Path((tmp_output / function_name)).with_suffix(".air").write_bytes(contents)
 
-            print("- Decompiling .air files to .ll")
-            ll_files = []
-            for air_file in Path(tmp_output).glob("*.air"):
-                ll_file = self._decompile_air_to_ll(air_file)
-                ll_files.append(ll_file)
+            # Each .air is independent and the work happens in the Metal toolchain, so threads are enough
+            with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+                print("- Decompiling .air files to .ll")
+                ll_files = list(executor.map(self._decompile_air_to_ll, Path(tmp_output).glob("*.air")))
 
-            print("- Patching .ll files")
-            for ll_file in ll_files:
-                self._patch_ll(ll_file)
+                print("- Patching .ll files")
+                list(executor.map(self._patch_ll, ll_files))
 
-            print("- Recompiling .ll files to .air")
-            air_files = []
-            for ll_file in ll_files:
-                air_file = self._recompile_ll_to_air(ll_file)
-                air_files.append(air_file)
+                print("- Recompiling .ll files to .air")
+                air_files = list(executor.map(self._recompile_ll_to_air, ll_files))
 
             if len(air_files) == 0:
                 print("- No .air files to pack")
@@ -386,11 +439,28 @@ class MetallibPatch:
         """
         Patch all .metallib files in the given directory
         """
-        if use_multiprocessing is True:
-            files = list(Path(input).rglob("**/*.metallib"))
-            with multiprocessing.Pool() as pool:
-                # Use the pool to process files in parallel
-                pool.starmap(self._patch_all_process_individual_file, [(file,) for file in files])
+        files = [Path(file) for file in iter_metallibs(input)]
+        if use_multiprocessing is True and len(files) >= MULTIPROCESSING_THRESHOLD:
+            with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+                futures = {executor.submit(_patch_one, file): file for file in files}
+                # Handle results as they finish, so one slow metallib doesn't hold back reporting a failure
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        # Drop anything not yet started, there's no point patching a tree we're about to fail
+                        executor.shutdown(wait=True, cancel_futures=True)
+                        raise Exception(f"Failed to patch {futures[future]}: {e}")
         else:
-            for file in Path(input).rglob("**/*.metallib"):
-                self._patch_all_process_individual_file(file)
\ No newline at end of file
+            for file in files:
+                self._patch_all_process_individual_file(file)
+
+
+def _patch_one(file: Path) -> None:
+    """
+    patch_all()'s multiprocessing worker
+
+    Constructs a fresh MetallibPatch inside the worker process to avoid sharing state
+    Each process handles its .air files serially, the pool already occupies every core
+    """
+    MetallibPatch(max_workers=1)._patch_all_process_individual_file(file)
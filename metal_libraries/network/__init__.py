@@ -1,2 +1,2 @@
 from .download import DownloadObject, DownloadStatus
-from .utilities import NetworkUtilities, human_fmt, get_free_space
\ No newline at end of file
+from .utilities import NetworkUtilities, SESSION, human_fmt, get_free_space, validate_link, verify_network_connection
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""
+cache.py: On-disk HTTP cache for conditional GET requests
+"""
+
+import os
+import json
+import hashlib
+import logging
+import requests
+
+from typing import Optional
+from pathlib import Path
+
+
+CACHE_DIRECTORY = Path.home() / ".cache" / "metallibsupportpkg"
+
+# Only validators, content metadata and pagination links are persisted
+# Transient headers (Date, Set-Cookie, rate limits, etc.) are discarded
+CACHED_HEADERS = ["ETag", "Last-Modified", "Content-Type", "Link"]
+
+
+class HTTPCache:
+    """
+    Stores response bodies keyed by URL, revalidated with ETag/Last-Modified
+
+    Usage:
+        >>> cache = HTTPCache(url)
+        >>> response = SESSION.get(url, headers=cache.headers())
+        >>> if response.status_code == 304:
+        >>>     response = cache.response()
+        >>> else:
+        >>>     cache.store(response)
+    """
+
+    def __init__(self, url: str) -> None:
+        self.url: str = url
+
+        key = hashlib.sha256(url.encode(), usedforsecurity=False).hexdigest()
+        self._metadata_file: Path = CACHE_DIRECTORY / f"{key}.json"
+        self._body_file:     Path = CACHE_DIRECTORY / f"{key}.body"
+
+        self._metadata: Optional[dict]  = None
+        self._body:     Optional[bytes] = None
+
+        self._load()
+
+
+    def _load(self) -> None:
+        """
+        Load the cached entry, if it exists and belongs to this URL
+        """
+        try:
+            metadata = json.loads(self._metadata_file.read_text())
+            if metadata.get("url") != self.url:
+                return
+            body = self._body_file.read_bytes()
+        except (OSError, ValueError):
+            return
+
+        self._metadata = metadata
+        self._body     = body
+
+
+    def headers(self) -> dict:
+        """
+        Conditional request headers for the cached entry
+
+        Returns:
+            dict: If-None-Match/If-Modified-Since headers, empty if nothing is cached
+        """
+        if self._metadata is None:
+            return {}
+
+        headers = {}
+        if "ETag" in self._metadata["headers"]:
+            headers["If-None-Match"] = self._metadata["headers"]["ETag"]
+        if "Last-Modified" in self._metadata["headers"]:
+            headers["If-Modified-Since"] = self._metadata["headers"]["Last-Modified"]
+        return headers
+
+
+    def response(self) -> Optional[requests.Response]:
+        """
+        Build a response object from the cached entry
+
+        Returns:
+            requests.Response: Cached response, or None if unavailable
+        """
+        if self._metadata is None:
+            return None
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = self.url
+        response.headers.update(self._metadata["headers"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = self._body
+
+        return response
+
+
+    def store(self, response: requests.Response) -> None:
+        """
+        Cache a successful response, if it can be revalidated later
+        """
+        if response.status_code != 200:
+            return
+
+        headers = {header: response.headers[header] for header in CACHED_HEADERS if header in response.headers}
+        if "ETag" not in headers and "Last-Modified" not in headers:
+            return
+
+        try:
+            CACHE_DIRECTORY.mkdir(parents=True, exist_ok=True)
+            for file, data in [
+                (self._body_file,     response.content),
+                (self._metadata_file, json.dumps({"url": self.url, "headers": headers}).encode()),
+            ]:
+                # Write to a sibling and rename, so an interrupted run never leaves a partial entry
+                temp_file = file.with_suffix(f"{file.suffix}.tmp")
+                temp_file.write_bytes(data)
+                os.replace(temp_file, file)
+        except OSError as error:
+            logging.warning(f"Error caching response for {self.url}: {error}")
+            return
+
+        self._metadata = {"url": self.url, "headers": headers}
+        self._body     = response.content
@@ -2,20 +2,39 @@
 download.py: Download files from the network
 """
 
+import os
+import sys
+import json
+import fcntl
+import math
+import mmap
 import time
-import requests
 import threading
 import logging
 import enum
 import hashlib
 import atexit
+import queue
+import shutil
+import contextlib
 
 from typing import Union
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from .utilities import NetworkUtilities, human_fmt, get_free_space
+from .utilities import NetworkUtilities, SESSION, human_fmt, get_free_space, verify_network_connection
 
-SESSION = requests.Session()
+# Files at least this large are fetched as parallel byte ranges, if the server supports it
+RANGED_DOWNLOAD_PART_SIZE: int = 1024 * 1024 * 64
+RANGED_DOWNLOAD_WORKERS:   int = 8
+RANGED_DOWNLOAD_RETRIES:   int = 3
+
+# Streamed downloads are copied in large reads, reporting progress every ~400 MiB
+SEQUENTIAL_DOWNLOAD_CHUNK_SIZE:        int = 1024 * 1024 * 16
+SEQUENTIAL_DOWNLOAD_PROGRESS_INTERVAL: int = 25
+
+# Chunks waiting to be hashed, bounds the memory held by the hashing thread
+BACKGROUND_HASH_QUEUE_SIZE: int = 4
 
 
 class DownloadStatus(enum.Enum):
@@ -29,6 +48,96 @@ class DownloadStatus(enum.Enum):
     COMPLETE:    str = "Complete"
 
 
+def _disable_page_cache(fd: int) -> None:
+    """
+    Keep a file that's only written once from evicting the rest of the page cache
+
+    macOS only (F_NOCACHE), a no-op elsewhere
+    """
+    if sys.platform != "darwin":
+        return
+    try:
+        fcntl.fcntl(fd, getattr(fcntl, "F_NOCACHE", 48), 1)
+    except OSError as e:
+        logging.warning(f"Unable to disable caching: {str(e)}")
+
+
+class _RangeNotHonoured(Exception):
+    """
+    Raised when a server answers a byte range request with anything but the requested range
+    """
+
+
+class _BackgroundHasher:
+    """
+    Feeds a hash object from its own thread, so hashing a chunk overlaps reading the next
+
+    hashlib releases the GIL while hashing large buffers
+    The queue is bounded, a slow hash holds back the download rather than buffering it in memory
+    """
+
+    def __init__(self, checksum) -> None:
+        self._checksum = checksum
+        self._queue    = queue.Queue(maxsize=BACKGROUND_HASH_QUEUE_SIZE)
+        self._thread   = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    def _run(self) -> None:
+        while (chunk := self._queue.get()) is not None:
+            self._checksum.update(chunk)
+
+
+    def update(self, chunk: bytes) -> None:
+        self._queue.put(chunk)
+
+
+    def __enter__(self) -> "_BackgroundHasher":
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        # Drain the queue, the hash is complete once the thread exits
+        self._queue.put(None)
+        self._thread.join()
+
+
+class _TeeWriter:
+    """
+    File-like target for shutil.copyfileobj(), tracking a sequential download's progress
+
+    Each chunk written is forwarded to the file and, if given, the hasher
+    """
+
+    def __init__(self, download_object: "DownloadObject", file, display_progress: bool = False, hasher: _BackgroundHasher = None) -> None:
+        self._download_object  = download_object
+        self._file             = file
+        self._display_progress = display_progress
+        self._hasher           = hasher
+        self._chunks           = 0
+
+
+    def write(self, chunk: bytes) -> int:
+        download_object = self._download_object
+        if download_object.should_stop:
+            raise Exception("Download stopped")
+
+        self._file.write(chunk)
+        download_object.downloaded_file_size += len(chunk)
+        if self._hasher is not None:
+            self._hasher.update(chunk)
+
+        if self._display_progress and self._chunks % SEQUENTIAL_DOWNLOAD_PROGRESS_INTERVAL == 0:
+            # Don't use logging here, as we'll be spamming the log file
+            if download_object.total_file_size == 0.0:
+                print(f"Downloaded {human_fmt(download_object.downloaded_file_size)} of {download_object.filename}")
+            else:
+                print(f"Downloaded {download_object.get_percent():.2f}% of {download_object.filename} ({human_fmt(download_object.get_speed())}/s) ({download_object.get_time_remaining():.2f} seconds remaining)")
+        self._chunks += 1
+
+        return len(chunk)
+
+
 class DownloadObject:
     """
     Object for downloading files from the network
@@ -47,7 +156,7 @@ class DownloadObject:
 
     """
 
-    def __init__(self, url: str, path: str) -> None:
+    def __init__(self, url: str, path: str, checksum_algorithm: str = "sha256") -> None:
         self.url:       str = url
         self.status:    str = DownloadStatus.INACTIVE
         self.error_msg: str = ""
@@ -57,16 +166,21 @@ class DownloadObject:
 
         self.total_file_size:      float = 0.0
         self.downloaded_file_size: float = 0.0
-        self.start_time:           float = time.time()
+        self.supports_ranges:      bool  = False
+        self.start_time:           float = time.monotonic()
+
+        self._progress_lock: threading.Lock = threading.Lock()
 
         self.error:             bool = False
-        self.should_stop:       bool = False
         self.download_complete: bool = False
-        self.has_network:       bool = NetworkUtilities(self.url).verify_network_connection()
+        self.has_network:       bool = verify_network_connection(self.url)
 
         self.active_thread: threading.Thread = None
+        self._stop_event:   threading.Event  = threading.Event()
+        self._done:         threading.Event  = threading.Event()
 
-        self.should_checksum: bool = False
+        self.should_checksum:    bool = False
+        self.checksum_algorithm: str  = checksum_algorithm
 
         self.checksum = None
         self._checksum_storage: hash = None
@@ -79,6 +193,14 @@ class DownloadObject:
         self.stop()
 
 
+    @property
+    def should_stop(self) -> bool:
+        """
+        Whether stop() has been requested
+        """
+        return self._stop_event.is_set()
+
+
     def download(self, display_progress: bool = False, spawn_thread: bool = True, verify_checksum: bool = False) -> None:
         """
         Download the file
@@ -90,14 +212,23 @@ class DownloadObject:
             display_progress (bool): Display progress in console
             spawn_thread (bool): Spawn a thread to download the file, otherwise download in the current thread
             verify_checksum (bool): Calculate checksum of downloaded file if True
+                                    Hashed while downloading, available in self.checksum once complete
 
         """
+        # Checked before any state is reset, a rejected call mustn't disturb the running download
+        if self.active_thread and (spawn_thread or self.active_thread.is_alive()):
+            logging.error("Download already in progress")
+            return
+
+        # A single hash object is fed the whole file as it arrives
+        self.checksum          = None
+        self._checksum_storage = self._new_checksum() if verify_checksum else None
         self.status = DownloadStatus.DOWNLOADING
         logging.info(f"Starting download: {self.filename}")
+        # Stop cleanly if the interpreter exits mid-download, released once _download() finishes
+        atexit.register(self.stop)
+        self._done.clear()
         if spawn_thread:
-            if self.active_thread:
-                logging.error("Download already in progress")
-                return
             self.should_checksum = verify_checksum
             self.active_thread = threading.Thread(target=self._download, args=(display_progress,))
             self.active_thread.start()
@@ -119,16 +250,22 @@ class DownloadObject:
             Otherwise, returns True if download was successful, False otherwise
         """
 
-        if verify_checksum:
-            self.should_checksum = True
-            self.checksum = hashlib.sha256()
-
-        self.download(spawn_thread=False)
+        self.download(spawn_thread=False, verify_checksum=verify_checksum)
 
         if not self.download_complete:
             return False
 
-        return self.checksum.hexdigest() if self.checksum else True
+        return self.checksum.hexdigest() if verify_checksum else True
+
+
+    def _new_checksum(self):
+        """
+        Create an empty hash object for the checksum algorithm
+
+        Integrity check only, usedforsecurity=False keeps SHA-1 available on FIPS-restricted OpenSSL builds
+        """
+
+        return hashlib.new(self.checksum_algorithm, usedforsecurity=False)
 
 
     def _get_filename(self) -> str:
@@ -153,6 +290,7 @@ class DownloadObject:
             result = SESSION.head(self.url, allow_redirects=True, timeout=5)
             if 'Content-Length' in result.headers:
                 self.total_file_size = float(result.headers['Content-Length'])
+                self.supports_ranges = result.headers.get('Accept-Ranges', '').lower() == 'bytes'
             else:
                 raise Exception("Content-Length missing from headers")
         except Exception as e:
@@ -161,16 +299,6 @@ class DownloadObject:
             self.total_file_size = 0.0
 
 
-    def _update_checksum(self, chunk: bytes) -> None:
-        """
-        Update checksum with new chunk
-
-        Parameters:
-            chunk (bytes): Chunk to update checksum with
-        """
-        self._checksum_storage.update(chunk)
-
-
     def _prepare_working_directory(self, path: Path) -> bool:
         """
         Validates working enviroment, including free space and removing existing files
@@ -209,6 +337,195 @@ class DownloadObject:
         return True
 
 
+    def _progress_file(self) -> Path:
+        """
+        Sidecar file recording the completed parts of a ranged download
+        """
+
+        return self.filepath.with_name(f"{self.filepath.name}.progress")
+
+
+    def _load_progress(self, part_count: int) -> set:
+        """
+        Load the completed parts of a previous ranged download
+
+        Parameters:
+            part_count (int): Number of parts in the current download
+
+        Returns:
+            set: Indexes of completed parts, empty if the download can't be resumed
+        """
+
+        try:
+            progress = json.loads(self._progress_file().read_text())
+        except (OSError, ValueError):
+            return set()
+
+        if progress.get("url") != self.url or progress.get("size") != self.total_file_size:
+            return set()
+        if not self.filepath.exists() or self.filepath.stat().st_size != self.total_file_size:
+            return set()
+
+        return {part for part in progress.get("parts", []) if 0 <= part < part_count}
+
+
+    def _save_progress(self, completed_parts: set) -> None:
+        """
+        Persist the completed parts of a ranged download
+
+        Parameters:
+            completed_parts (set): Indexes of completed parts
+        """
+
+        progress_file = self._progress_file()
+        temp_file = progress_file.with_name(f"{progress_file.name}.tmp")
+        temp_file.write_text(json.dumps({"url": self.url, "size": self.total_file_size, "parts": sorted(completed_parts)}))
+        os.replace(temp_file, progress_file)
+
+
+    def _download_part(self, fd: int, index: int) -> int:
+        """
+        Download a single byte range into the preallocated file
+
+        Parameters:
+            fd (int): File descriptor of the preallocated file
+            index (int): Index of the part to download
+
+        Returns:
+            int: Index of the downloaded part
+        """
+
+        start = index * RANGED_DOWNLOAD_PART_SIZE
+        end   = min(start + RANGED_DOWNLOAD_PART_SIZE, int(self.total_file_size)) - 1
+
+        for attempt in range(RANGED_DOWNLOAD_RETRIES):
+            offset = start
+            try:
+                with SESSION.get(self.url, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=10) as response:
+                    if response.status_code != 206:
+                        raise _RangeNotHonoured(f"Range request not honoured (status code {response.status_code})")
+                    content_range = response.headers.get("Content-Range", "")
+                    if content_range.partition("/")[0] != f"bytes {start}-{end}":
+                        raise _RangeNotHonoured(f"Requested bytes {start}-{end}, received '{content_range}'")
+                    for chunk in response.iter_content(1024 * 1024):
+                        if self.should_stop:
+                            raise Exception("Download stopped")
+                        os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                        with self._progress_lock:
+                            self.downloaded_file_size += len(chunk)
+                if offset != end + 1:
+                    raise Exception(f"Received {offset - start} of {end + 1 - start} bytes")
+                return index
+            except Exception as e:
+                with self._progress_lock:
+                    self.downloaded_file_size -= offset - start
+                # Retrying won't change how the server treats ranges
+                if isinstance(e, _RangeNotHonoured) or self.should_stop or attempt == RANGED_DOWNLOAD_RETRIES - 1:
+                    raise
+                logging.warning(f"Retrying part {index} of {self.filename}: {str(e)}")
+
+
+    def _update_checksum_from_file(self, fd: int, completed_parts: set, hashed_parts: int) -> int:
+        """
+        Hash the contiguous run of completed parts following the already hashed ones
+
+        Parts finish out of order, so the checksum trails behind the first
+        incomplete part. Freshly written parts are read back from the page cache,
+        each hashed through a read-only mapping in a single call
+
+        Parameters:
+            fd (int): File descriptor of the preallocated file
+            completed_parts (set): Indexes of completed parts
+            hashed_parts (int): Number of leading parts already hashed
+
+        Returns:
+            int: Number of leading parts hashed
+        """
+
+        if hashed_parts not in completed_parts:
+            return hashed_parts
+
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            while hashed_parts in completed_parts:
+                offset = hashed_parts * RANGED_DOWNLOAD_PART_SIZE
+                end    = min(offset + RANGED_DOWNLOAD_PART_SIZE, int(self.total_file_size))
+                self._checksum_storage.update(view[offset:end])
+                hashed_parts += 1
+
+        return hashed_parts
+
+
+    def _download_ranged(self, display_progress: bool = False) -> None:
+        """
+        Download the file as parallel byte ranges
+
+        Completed parts are recorded in a sidecar file, so an interrupted
+        download resumes where it left off
+
+        Parameters:
+            display_progress (bool): Display progress in console
+        """
+
+        part_count = math.ceil(self.total_file_size / RANGED_DOWNLOAD_PART_SIZE)
+        completed_parts = self._load_progress(part_count)
+        if completed_parts:
+            logging.info(f"Resuming download: {self.filename} ({len(completed_parts)} of {part_count} parts complete)")
+        elif self._prepare_working_directory(self.filepath) is False:
+            raise Exception(self.error_msg)
+
+        self.downloaded_file_size = sum(
+            min(RANGED_DOWNLOAD_PART_SIZE, self.total_file_size - part * RANGED_DOWNLOAD_PART_SIZE) for part in completed_parts
+        )
+
+        fd = os.open(self.filepath, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, int(self.total_file_size))
+            hashed_parts = 0
+            with ThreadPoolExecutor(max_workers=RANGED_DOWNLOAD_WORKERS) as executor:
+                futures = [executor.submit(self._download_part, fd, part) for part in range(part_count) if part not in completed_parts]
+                try:
+                    for future in as_completed(futures):
+                        completed_parts.add(future.result())
+                        self._save_progress(completed_parts)
+                        if self.should_checksum:
+                            hashed_parts = self._update_checksum_from_file(fd, completed_parts, hashed_parts)
+                        if display_progress:
+                            print(f"Downloaded {self.get_percent():.2f}% of {self.filename} ({human_fmt(self.get_speed())}/s) ({self.get_time_remaining():.2f} seconds remaining)")
+                except Exception:
+                    for future in futures:
+                        future.cancel()
+                    raise
+            if self.should_checksum:
+                # Covers parts completed by a previous run that nothing after them triggered
+                self._update_checksum_from_file(fd, completed_parts, hashed_parts)
+        finally:
+            os.close(fd)
+
+        self._progress_file().unlink(missing_ok=True)
+
+
+    def _download_sequential(self, display_progress: bool = False) -> None:
+        """
+        Download the file as a single stream
+
+        Parameters:
+            display_progress (bool): Display progress in console
+        """
+
+        if self._prepare_working_directory(self.filepath) is False:
+            raise Exception(self.error_msg)
+
+        response = NetworkUtilities().get(self.url, stream=True, timeout=10)
+        # Reading the raw stream skips requests' decoding, so undo any Content-Encoding here
+        response.raw.decode_content = True
+
+        hasher = _BackgroundHasher(self._checksum_storage) if self.should_checksum else None
+        with open(self.filepath, 'wb') as file, (hasher or contextlib.nullcontext()):
+            _disable_page_cache(file.fileno())
+            shutil.copyfileobj(response.raw, _TeeWriter(self, file, display_progress, hasher), length=SEQUENTIAL_DOWNLOAD_CHUNK_SIZE)
+
+
     def _download(self, display_progress: bool = False) -> None:
         """
         Download the file
@@ -223,41 +540,40 @@ class DownloadObject:
             if not self.has_network:
                 raise Exception("No network connection")
 
-            if self._prepare_working_directory(self.filepath) is False:
-                raise Exception(self.error_msg)
-
-            response = NetworkUtilities().get(self.url, stream=True, timeout=10)
-
-            with open(self.filepath, 'wb') as file:
-                atexit.register(self.stop)
-                for i, chunk in enumerate(response.iter_content(1024 * 1024 * 4)):
-                    if self.should_stop:
-                        raise Exception("Download stopped")
-                    if chunk:
-                        file.write(chunk)
-                        self.downloaded_file_size += len(chunk)
-                        if self.should_checksum:
-                            self._update_checksum(chunk)
-                        if display_progress and i % 100:
-                            # Don't use logging here, as we'll be spamming the log file
-                            if self.total_file_size == 0.0:
-                                print(f"Downloaded {human_fmt(self.downloaded_file_size)} of {self.filename}")
-                            else:
-                                print(f"Downloaded {self.get_percent():.2f}% of {self.filename} ({human_fmt(self.get_speed())}/s) ({self.get_time_remaining():.2f} seconds remaining)")
-                self.download_complete = True
-                logging.info(f"Download complete: {self.filename}")
-                logging.info("Stats:")
-                logging.info(f"- Downloaded size: {human_fmt(self.downloaded_file_size)}")
-                logging.info(f"- Time elapsed: {(time.time() - self.start_time):.2f} seconds")
-                logging.info(f"- Speed: {human_fmt(self.downloaded_file_size / (time.time() - self.start_time))}/s")
-                logging.info(f"- Location: {self.filepath}")
+            if self.supports_ranges and self.total_file_size >= RANGED_DOWNLOAD_PART_SIZE * 2:
+                try:
+                    self._download_ranged(display_progress)
+                except _RangeNotHonoured as e:
+                    # Advertised on HEAD but not honoured on GET, start over as a single stream
+                    logging.warning(f"Falling back to a single stream for {self.filename}: {str(e)}")
+                    self.supports_ranges      = False
+                    self.downloaded_file_size = 0.0
+                    self._progress_file().unlink(missing_ok=True)
+                    if self.should_checksum:
+                        self._checksum_storage = self._new_checksum()
+                    self._download_sequential(display_progress)
+            else:
+                self._download_sequential(display_progress)
+
+            if self.should_checksum:
+                self.checksum = self._checksum_storage
+            self.download_complete = True
+            logging.info(f"Download complete: {self.filename}")
+            logging.info("Stats:")
+            logging.info(f"- Downloaded size: {human_fmt(self.downloaded_file_size)}")
+            elapsed = time.monotonic() - self.start_time
+            logging.info(f"- Time elapsed: {elapsed:.2f} seconds")
+            logging.info(f"- Speed: {human_fmt(self.downloaded_file_size / elapsed)}/s")
+            logging.info(f"- Location: {self.filepath}")
         except Exception as e:
             self.error = True
             self.error_msg = str(e)
             self.status = DownloadStatus.ERROR
             logging.error(f"Error downloading {self.url}: {self.error_msg}")
-
-        self.status = DownloadStatus.COMPLETE
+        finally:
+            atexit.unregister(self.stop)
+            self.status = DownloadStatus.COMPLETE
+            self._done.set()
 
 
     def get_percent(self) -> float:
@@ -281,7 +597,7 @@ class DownloadObject:
             float: The download speed in bytes per second
         """
 
-        return self.downloaded_file_size / (time.time() - self.start_time)
+        return self.downloaded_file_size / (time.monotonic() - self.start_time)
 
 
     def get_time_remaining(self) -> float:
@@ -311,6 +627,20 @@ class DownloadObject:
         return self.total_file_size
 
 
+    def join(self, timeout: float = None) -> bool:
+        """
+        Wait for the download to finish, successfully or not
+
+        Parameters:
+            timeout (float): Seconds to wait, or None to wait indefinitely
+
+        Returns:
+            bool: True if the download finished, False if the timeout expired
+        """
+
+        return self._done.wait(timeout)
+
+
     def is_active(self) -> bool:
         """
         Query if the download is active
@@ -331,7 +661,6 @@ class DownloadObject:
         If the download is active, this function will hold the thread until stopped
         """
 
-        self.should_stop = True
-        if self.active_thread:
-            while self.active_thread.is_alive():
-                time.sleep(1)
\ No newline at end of file
+        self._stop_event.set()
+        if self.active_thread and self.active_thread is not threading.current_thread():
+            self.active_thread.join()
\ No newline at end of file
@@ -6,13 +6,71 @@ import shutil
 import logging
 import requests
 
+from urllib3.util.retry import Retry
 
+from .cache import HTTPCache
+from ..     import __version__, __url__
+
+
+# Shared by all network helpers, so connections are kept alive and reused across calls
+# Transient connection failures are retried with a short backoff before surfacing to callers
 SESSION = requests.Session()
+SESSION.headers["User-Agent"] = f"MetallibSupportPkg/{__version__} (+{__url__})"
+SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=20, max_retries=Retry(total=3, backoff_factor=0.3)))
+SESSION.mount("http://",  requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=20, max_retries=Retry(total=3, backoff_factor=0.3)))
+
+
+def verify_network_connection(url: str = "https://github.com") -> bool:
+    """
+    Verifies that the network is available
+
+    Parameters:
+        url (str): URL to reach
+
+    Returns:
+        bool: True if network is available, False otherwise
+    """
+
+    try:
+        SESSION.head(url, timeout=5, allow_redirects=True)
+        return True
+    except (
+        requests.exceptions.Timeout,
+        requests.exceptions.TooManyRedirects,
+        requests.exceptions.ConnectionError,
+        requests.exceptions.HTTPError
+    ):
+        return False
+
+
+def validate_link(url: str) -> bool:
+    """
+    Check for 404 error
+
+    Parameters:
+        url (str): URL to check
+
+    Returns:
+        bool: True if link is valid, False otherwise
+    """
+
+    try:
+        response = SESSION.head(url, timeout=5, allow_redirects=True)
+        return response.status_code != 404
+    except (
+        requests.exceptions.Timeout,
+        requests.exceptions.TooManyRedirects,
+        requests.exceptions.ConnectionError,
+        requests.exceptions.HTTPError
+    ):
+        return False
 
 
 class NetworkUtilities:
     """
     Utilities for network related tasks, primarily used for downloading files
+
+    URL checks are also available as module-level functions, which need no instance
     """
 
     def __init__(self, url: str = None) -> None:
@@ -29,17 +87,8 @@ class NetworkUtilities:
         Returns:
             bool: True if network is available, False otherwise
         """
+        return verify_network_connection(self.url)
 
-        try:
-            requests.head(self.url, timeout=5, allow_redirects=True)
-            return True
-        except (
-            requests.exceptions.Timeout,
-            requests.exceptions.TooManyRedirects,
-            requests.exceptions.ConnectionError,
-            requests.exceptions.HTTPError
-        ):
-            return False
 
     def validate_link(self) -> bool:
         """
@@ -48,19 +97,7 @@ class NetworkUtilities:
         Returns:
             bool: True if link is valid, False otherwise
         """
-        try:
-            response = SESSION.head(self.url, timeout=5, allow_redirects=True)
-            if response.status_code == 404:
-                return False
-            else:
-                return True
-        except (
-            requests.exceptions.Timeout,
-            requests.exceptions.TooManyRedirects,
-            requests.exceptions.ConnectionError,
-            requests.exceptions.HTTPError
-        ):
-            return False
+        return validate_link(self.url)
 
 
     def get(self, url: str, **kwargs) -> requests.Response:
@@ -68,6 +105,9 @@ class NetworkUtilities:
         Wrapper for requests's get method
         Implement additional error handling
 
+        Non-streamed responses are cached on disk and revalidated
+        with If-None-Match/If-Modified-Since on subsequent calls
+
         Parameters:
             url (str): URL to get
             **kwargs: Additional parameters for requests.get
@@ -78,6 +118,11 @@ class NetworkUtilities:
 
         result: requests.Response = None
 
+        cache: HTTPCache = None
+        if kwargs.get("stream", False) is False:
+            cache = HTTPCache(url)
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), **cache.headers()}
+
         try:
             result = SESSION.get(url, **kwargs)
         except (
@@ -90,6 +135,11 @@ class NetworkUtilities:
             # Return empty response object
             return requests.Response()
 
+        if cache is not None:
+            if result.status_code == 304:
+                return cache.response()
+            cache.store(result)
+
         return result
 
 
@@ -2,11 +2,22 @@
 ci_info.py: Get repository information
 """
 
+import io
 import os
+import ijson
+import requests
+import functools
+import urllib.parse
+
+from concurrent.futures import ThreadPoolExecutor
 
 from ..network import NetworkUtilities
 
 
+RELEASES_PER_PAGE:     int = 100
+RELEASES_PAGE_WORKERS: int = 8
+
+
 class CIInfo:
 
     def __init__(self) -> None:
@@ -16,15 +27,50 @@ class CIInfo:
     def published_releases(self) -> list[str]:
         """
         Get the published releases
+
+        Fetched once per process, later calls (from any instance) reuse the result
+        The response itself is cached on disk and revalidated by NetworkUtilities
         """
-        headers = {}
-        if "GITHUB_TOKEN" in os.environ:
-            headers = {"Authorization": f"token {os.environ['GITHUB_TOKEN']}"}
+        return list(_published_releases(self._url))
+
+
+@functools.lru_cache(maxsize=None)
+def _published_releases(url: str) -> tuple[str, ...]:
+    """
+    published_releases()'s cached lookup
+    """
+    headers = {}
+    if "GITHUB_TOKEN" in os.environ:
+        headers = {"Authorization": f"token {os.environ['GITHUB_TOKEN']}"}
+
+    # GitHub caps pages at 100 releases, the first page's 'last' link gives the page count
+    releases = _fetch_releases_page(f"{url}?per_page={RELEASES_PER_PAGE}", headers)
+
+    pages = [releases]
+    if "last" in releases.links:
+        last_page = int(urllib.parse.parse_qs(urllib.parse.urlparse(releases.links["last"]["url"]).query)["page"][0])
+        # Remaining pages are independent, fetch them together
+        with ThreadPoolExecutor(max_workers=RELEASES_PAGE_WORKERS) as executor:
+            pages += executor.map(
+                lambda page: _fetch_releases_page(f"{url}?per_page={RELEASES_PER_PAGE}&page={page}", headers),
+                range(2, last_page + 1)
+            )
+
+    # Only tag names are needed, pull them out without materializing each release object
+    releases = [tag for page in pages for tag in ijson.items(io.BytesIO(page.content), "item.tag_name")]
+    return tuple(release.split("-")[1] for release in releases)
+
 
-        releases = NetworkUtilities().get(self._url, headers=headers)
-        if releases is None:
-            return []
+def _fetch_releases_page(url: str, headers: dict) -> requests.Response:
+    """
+    Fetch a single page of releases
 
-        releases = releases.json()
-        releases = [release["tag_name"] for release in releases]
-        return [release.split("-")[1] for release in releases]
\ No newline at end of file
+    Raises rather than returning a partial list, a missing page would mark published builds as unpublished
+    """
+    page = NetworkUtilities().get(url, headers=headers)
+    if page.status_code != 200:
+        raise Exception(f"Failed to fetch published releases from {url} (status code {page.status_code})")
+    # Streaming 'item.tag_name' out of an error object ({"message": ...}) silently yields nothing
+    if page.content.lstrip()[:1] != b"[":
+        raise Exception(f"Unexpected response fetching published releases from {url}: {page.content[:200]!r}")
+    return page
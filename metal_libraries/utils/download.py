@@ -2,32 +2,54 @@
 download.py
 """
 
-import time
 import hashlib
 
 from pathlib import Path
 
-from ..network import download, NetworkUtilities
+from ..network import download, validate_link
 
 
 class DownloadFile:
 
-    def __init__(self, url: str) -> None:
-        self._url = url
+    def __init__(self, url: str, expected_hash: str = None) -> None:
+        self._url           = url
+        self._expected_hash = expected_hash
+
+
+    def _parse_hash(self, expected_hash: str = None) -> tuple[str, str]:
+        """
+        Split an expected hash into its algorithm and digest
+
+        Accepts 'algorithm:digest' for any hashlib algorithm (ex. 'sha256:...')
+        Bare digests are SHA-1, as published by AppleDB
+        """
+        if expected_hash is None:
+            return "sha1", None
+
+        algorithm, separator, digest = expected_hash.rpartition(":")
+        if not separator:
+            return "sha1", expected_hash.lower()
+
+        algorithm = algorithm.lower()
+        if algorithm not in hashlib.algorithms_available:
+            raise Exception(f"Unsupported hash algorithm: {algorithm}")
+
+        return algorithm, digest.lower()
 
 
     def _download_item(self, url: str, expected_hash: str = None) -> str:
         name = Path(url).name
+        algorithm, expected_hash = self._parse_hash(expected_hash)
 
         # Check if URL is 404
-        if NetworkUtilities(url).validate_link() is False:
+        if _validate_link(url) is False:
             print(f"    {url} is a 404")
             raise Exception(f"{url} is a 404")
 
-        download_obj = download.DownloadObject(url, name)
-        download_obj.download()
-        while download_obj.is_active():
-            time.sleep(5)
+        download_obj = download.DownloadObject(url, name, checksum_algorithm=algorithm)
+        # Hash while downloading rather than re-reading the file afterwards
+        download_obj.download(verify_checksum=expected_hash is not None)
+        download_obj.join()
 
         if not download_obj.download_complete:
             print("")
@@ -37,28 +59,18 @@ class DownloadFile:
 
         # Check if we downloaded an HTML file
         if not name.endswith("html"):
-            # Check if content starts with '<!DOCTYPE html>'
-            with open(name, "r") as f:
-                try:
-                    if f.read(15) == "<!DOCTYPE html>":
-                        print(f"    {url} is a 404")
-                        raise Exception(f"{url} is a 404")
-                except UnicodeDecodeError:
-                    pass
-
-        if expected_hash:
-            sha1 = hashlib.sha1()
+            # Check if content starts with '<!DOCTYPE html>', compared as bytes so binaries don't need decoding
             with open(name, "rb") as f:
-                while True:
-                    data = f.read(65536)
-                    if not data:
-                        break
-                    sha1.update(data)
+                if f.read(15) == b"<!DOCTYPE html>":
+                    print(f"    {url} is a 404")
+                    raise Exception(f"{url} is a 404")
 
-            if sha1.hexdigest() != expected_hash:
+        if expected_hash:
+            checksum = download_obj.checksum.hexdigest()
+            if checksum != expected_hash:
                 print(f"  Hash mismatch for {name}")
                 print(f"  Expected: {expected_hash}")
-                print(f"  Got:      {sha1.hexdigest()}")
+                print(f"  Got:      {checksum}")
                 raise Exception(f"Hash mismatch for {name}")
 
         return name
@@ -68,4 +80,20 @@ class DownloadFile:
         """
         Download file.
         """
-        return self._download_item(self._url)
\ No newline at end of file
+        return self._download_item(self._url, self._expected_hash)
+
+
+# URLs found valid this process, failures aren't recorded as they may be transient (timeouts, dropped connections)
+_VALID_LINKS: set = set()
+
+
+def _validate_link(url: str) -> bool:
+    """
+    Validate a link, repeated checks of a URL already found valid reuse the result
+    """
+    if url in _VALID_LINKS:
+        return True
+    if validate_link(url) is False:
+        return False
+    _VALID_LINKS.add(url)
+    return True
@@ -3,6 +3,8 @@
 log.py: Display subprocess error output in formatted string.
 """
 
+import io
+import sys
 import subprocess
 
 
@@ -13,10 +15,12 @@ def log(process: subprocess.CompletedProcess) -> None:
     def format_output(output: str) -> str:
         if not output:
             return "        None\n"
-        _result = "\n".join([f"        {line}" for line in output.split("\n") if line not in ["", "\n"]])
-        if not _result.endswith("\n"):
-            _result += "\n"
-        return _result
+        # Indent each non-empty line as it's written, rather than building intermediate lists
+        _result = io.StringIO()
+        for line in output.splitlines():
+            if line:
+                _result.write(f"        {line}\n")
+        return _result.getvalue() or "\n"
 
     output = "Subprocess failed.\n"
     output += f"    Command: {process.args}\n"
@@ -31,4 +35,7 @@ def log(process: subprocess.CompletedProcess) -> None:
         output += format_output(process.stderr)
     else:
         output += "        None\n"
-    print(output)
\ No newline at end of file
+
+    # Single write, blank line included, flushed so it lands in order with the calling process' output
+    sys.stdout.write(output + "\n")
+    sys.stdout.flush()
\ No newline at end of file
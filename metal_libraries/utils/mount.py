@@ -14,7 +14,9 @@ class MountDMG:
 
     def __enter__(self):
         self.mount_point = tempfile.mkdtemp()
-        subprocess.check_call(['/usr/bin/hdiutil', 'attach', '-mountpoint', self.mount_point, self.dmg_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # The IPSW's checksum was already verified on download, skip hdiutil's own pass over the image
+        # Mounted read-only and hidden from Finder, nothing is written to the system volume
+        subprocess.check_call(['/usr/bin/hdiutil', 'attach', '-nobrowse', '-readonly', '-noverify', '-noautoopen', '-mountpoint', self.mount_point, self.dmg_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         return self.mount_point
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -2,8 +2,28 @@
 patch_format.py: Generate a dictionary of system patches
 """
 
+import io
+import os
+
+from types   import MappingProxyType
 from pathlib import Path
 
+from .walk import iter_metallibs
+
+
+# Always installed from 14.6.1, read-only as it's shared by every fetch_sys_patch_dict() call
+DEFAULT_INSTALL = MappingProxyType({
+    "/System/Library/Frameworks/CoreImage.framework/Versions/A": MappingProxyType({
+        "CoreImage.metallib": "14.6.1"
+    }),
+    "/System/Library/Frameworks/MetalPerformanceShaders.framework/Versions/A/Frameworks/MPSCore.framework/Versions/A/Resources": MappingProxyType({
+        "default.metallib":   "14.6.1"
+    }),
+})
+
+# Never replaced by the patched copies
+SKIPPED_DIRECTORIES = frozenset(DEFAULT_INSTALL)
+
 
 class GenerateSysPatchDictionary:
 
@@ -15,26 +35,18 @@ class GenerateSysPatchDictionary:
         """
         """
         sys_patch_dict = {
-            "Install": {
-                "/System/Library/Frameworks/CoreImage.framework/Versions/A": {
-                    "CoreImage.metallib": "14.6.1"
-                },
-                "/System/Library/Frameworks/MetalPerformanceShaders.framework/Versions/A/Frameworks/MPSCore.framework/Versions/A/Resources": {
-                    "default.metallib":   "14.6.1"
-                },
-            }
+            "Install": {directory: dict(files) for directory, files in DEFAULT_INSTALL.items()}
         }
 
-        for metallib_file in self._directory.rglob("**/*.metallib"):
-            parent_directory = Path("/") / metallib_file.parent.relative_to(self._directory)
+        root  = str(self._directory)
+        value = self._directory.name
 
-            file = metallib_file.name
-            value = self._directory.name
+        for metallib_file in iter_metallibs(root):
+            # Walked paths are prefixed by root, so the install path is the remainder
+            parent_directory, file = os.path.split(metallib_file)
+            parent_directory = parent_directory[len(root):] or "/"
 
-            if parent_directory in [
-                "/System/Library/Frameworks/CoreImage.framework/Versions/A",
-                "/System/Library/Frameworks/MetalPerformanceShaders.framework/Versions/A/Frameworks/MPSCore.framework/Versions/A/Resources",
-            ]:
+            if parent_directory in SKIPPED_DIRECTORIES:
                 continue
 
             if parent_directory not in sys_patch_dict["Install"]:
@@ -49,15 +61,19 @@ class GenerateSysPatchDictionary:
         """
         """
         sys_patch_dict = self.fetch_sys_patch_dict()
-        output = "{\n"
+
+        # Python dict literal rather than JSON, trailing commas included
+        output = io.StringIO()
+        write = output.write
+        write("{\n")
         for key, value in sys_patch_dict.items():
-            output += f"    \"{key}\": {{\n"
+            write(f"    \"{key}\": {{\n")
             for sub_key, sub_value in value.items():
-                output += f"        \"{sub_key}\": {{\n"
+                write(f"        \"{sub_key}\": {{\n")
                 for sub_sub_key, sub_sub_value in sub_value.items():
-                    output += f"            \"{sub_sub_key}\": \"{sub_sub_value}\",\n"
-                output += "        },\n"
-            output += "    },\n"
-        output += "}\n"
+                    write(f"            \"{sub_sub_key}\": \"{sub_sub_value}\",\n")
+                write("        },\n")
+            write("    },\n")
+        write("}\n")
 
-        return output
\ No newline at end of file
+        return output.getvalue()
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""
+walk.py: Locate '.metallib' files in a directory tree
+"""
+
+import os
+
+from typing import Iterator
+
+
+def iter_metallibs(root: str, skip_directories: tuple = ()) -> Iterator[str]:
+    """
+    Yield the path of every .metallib file under root
+
+    Walks with os.scandir() rather than Path.rglob(), reusing each DirEntry's cached
+    type information, and never descends into symlinks or skip_directories
+
+    Parameters:
+        root:             Directory to walk
+        skip_directories: Directory path suffixes to prune from the walk
+    """
+    skip_directories = tuple(skip_directories)
+    directories = [str(root)]
+    while directories:
+        try:
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    if entry.is_symlink():
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if not skip_directories or not entry.path.endswith(skip_directories):
+                            directories.append(entry.path)
+                    elif entry.name.endswith(".metallib"):
+                        yield entry.path
+        except OSError:
+            # Missing or unreadable directories are skipped, matching rglob()
+            continue